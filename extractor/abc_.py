@@ -4,8 +4,13 @@
 
 from gallery_dl.extractor.common import Extractor, Message
 from gallery_dl import text, util, exception
+from gallery_dl.cache import cache
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from functools import reduce
 from operator import getitem
+import json
+import re
 
 
 LISTEN_PATTERN = (
@@ -23,6 +28,12 @@ class AbcListenExtractor(AbcExtractor):
     """Base class for ABC Listen extractors"""
     root = "https://www.abc.net.au"
 
+    def _fetch_document_props(self, url):
+        """Return 'documentProps' of an episode page"""
+        return _next_data(
+            self.request(url, notfound="episode").content,
+            ("props", "pageProps", "data", "documentProps"))
+
 
 class AbcIviewExtractor(AbcExtractor):
     """Base class for ABC iview extractors"""
@@ -75,6 +86,7 @@ class AbcListenEpisodeExtractor(AbcListenExtractor):
     def __init__(self, match):
         AbcListenExtractor.__init__(self, match)
         self.webpage = "".join((self.root, match.group(1), match.group(2)))
+        self.article_id = match.group(2).rpartition("/")[2]
 
     @staticmethod
     def prepare(data):
@@ -83,9 +95,10 @@ class AbcListenEpisodeExtractor(AbcListenExtractor):
         data["date_updated"] = text.parse_datetime(dp["updatedDate"])
 
     def items(self):
-        next_data = _next_data(
-            self.request(self.webpage, notfound="episode").text)
-        dp = next_data["props"]["pageProps"]["data"]["documentProps"]
+        # parsed by AbcListenProgramExtractor
+        dp = _prefetched.pop(self.article_id, None)
+        if dp is None:
+            dp = self._fetch_document_props(self.webpage)
         self.prepare(dp)
 
         yield Message.Directory, dp
@@ -107,15 +120,44 @@ class AbcListenEpisodeExtractor(AbcListenExtractor):
                 data.update(dp)
                 yield Message.Url, image_url, data
 
-        for rendition in dp["renditions"]:
+        for rendition in self.renditions(dp["renditions"]):
             file = rendition.copy()
             url = file["url"]
-            if not url:
-                continue
             text.nameext_from_url(url, file)
             file.update(dp)
             yield Message.Url, url, file
 
+    def renditions(self, renditions):
+        """Return renditions selected by the 'rendition' option"""
+        renditions = [r for r in renditions if r["url"]]
+        policy = self.config("rendition", "all")
+        if not renditions or policy == "all":
+            return renditions
+
+        if policy == "best":
+            return (max(renditions, key=_rendition_quality),)
+        if policy == "worst":
+            return (min(renditions, key=_rendition_quality),)
+
+        if isinstance(policy, int):
+            # maximum bitrate
+            candidates = [r for r in renditions
+                          if (r.get("bitrate") or 0) <= policy]
+            if candidates:
+                return (max(candidates, key=_rendition_quality),)
+            return (min(renditions, key=_rendition_quality),)
+
+        # codec preference list
+        if isinstance(policy, str):
+            policy = policy.split(",")
+        for codec in policy:
+            codec = codec.strip().lower()
+            candidates = [r for r in renditions
+                          if (r.get("codec") or "").lower() == codec]
+            if candidates:
+                return (max(candidates, key=_rendition_quality),)
+        return (max(renditions, key=_rendition_quality),)
+
 
 class AbcListenProgramExtractor(AbcListenExtractor):
     """Extractor for a program"""
@@ -157,12 +199,16 @@ class AbcListenProgramExtractor(AbcListenExtractor):
         AbcListenExtractor.__init__(self, match)
         self.webpage = self.root + match.group(1)
 
+    def _init(self):
+        self.workers = workers = self.config("workers", 1)
+        self.pool = ThreadPoolExecutor(workers) if workers > 1 else None
+
     def _image(self):
         if not self.config("image", False):
             return
-        next_data = _next_data(
-            self.request(self.webpage, notfound="program").text)
-        pp = next_data["props"]["pageProps"]
+        pp = _next_data(
+            self.request(self.webpage, notfound="program").content,
+            ("props", "pageProps"))
         data = pp["heroDescriptionPrepared"].copy()
         data["presentersPrepared"] = pp["presentersPrepared"]
         try:
@@ -189,12 +235,83 @@ class AbcListenProgramExtractor(AbcListenExtractor):
     def items(self):
         yield from self._image()
 
-        next_data = _next_data(
-            self.request(self.webpage + "/episodes", notfound="program").text)
-        for item in (next_data["props"]["pageProps"]
-                     ["programCollectionPrepared"]["items"]):
-            yield (Message.Queue, self.root + item["articleLink"],
+        items = _next_data(
+            self.request(self.webpage + "/episodes", notfound="program")
+            .content, ("props", "pageProps", "programCollectionPrepared"),
+        )["items"]
+
+        if self.pool:
+            try:
+                yield from self._queue_concurrent(items)
+            finally:
+                self.pool.shutdown(False, cancel_futures=True)
+            return
+
+        for item in items:
+            url = self.root + item["articleLink"]
+            yield from self._queue(url, self._cached_document_props(url, item))
+
+    def _queue_concurrent(self, items):
+        """Parse up to twice as many episode pages as there are workers
+        ahead of the current episode"""
+        window = deque()
+        for item in items:
+            url = self.root + item["articleLink"]
+            dp = self._cached_document_props(url, item)
+            future = None if dp else self.pool.submit(
+                self._fetch_document_props, url)
+            window.append((url, dp, future))
+            if len(window) >= self.workers * 2:
+                yield from self._queue(*self._result(*window.popleft()))
+        while window:
+            yield from self._queue(*self._result(*window.popleft()))
+
+    def _queue(self, url, dp):
+        """Queue an episode and hand its 'documentProps' over, if any"""
+        article_id = url.rpartition("/")[2]
+        if dp is not None:
+            _prefetched[article_id] = dp
+        try:
+            yield (Message.Queue, url,
                    {"_extractor": AbcListenEpisodeExtractor})
+        finally:
+            # still present if the episode extractor did not run
+            _prefetched.pop(article_id, None)
+
+    @staticmethod
+    def _cached_document_props(url, item):
+        """Return cached 'documentProps' of an unchanged episode or None"""
+        updated = _try_retrieve(item, (
+            ("datelinePrepared", "updatedDate"),
+            ("updatedDate",),
+        ))
+        if updated:
+            return _document_props_cache("{}_{}".format(
+                url.rpartition("/")[2], updated))
+        return None
+
+    def _result(self, url, dp, future):
+        """Return 'url' and the 'documentProps' parsed by 'future'
+
+        Cache access happens here, in the main thread, since the
+        cache database connection is shared.
+        """
+        if future is None:
+            return url, dp
+        try:
+            dp = future.result()
+        except Exception as exc:
+            # let the episode extractor try again and report errors
+            self.log.debug("%s: %s: %s", url, exc.__class__.__name__, exc)
+            return url, None
+
+        try:
+            _document_props_cache.update("{}_{}".format(
+                url.rpartition("/")[2],
+                dp["datelinePrepared"]["updatedDate"]), dp)
+        except KeyError:
+            pass
+        return url, dp
 
 
 class AbcIviewVideoExtractor(AbcIviewExtractor):
@@ -358,7 +475,7 @@ class AbcIviewProgramExtractor(AbcIviewExtractor):
         response = self.request(
             "{}/show/{}".format(self.root, self.series_name),
             notfound="program")
-        pd = _initial_state(response.text)["route"]["pageData"]
+        pd = _initial_state(response.content, ("route", "pageData"))
         series_list = pd["_embedded"].pop("seriesList", None)
 
         pd["date"] = text.parse_datetime(pd["updated"], "%Y-%m-%d %H:%M:%S")
@@ -383,6 +500,17 @@ class AbcIviewProgramExtractor(AbcIviewExtractor):
 # Helper functions ############################################################
 
 
+# 'documentProps' of episode pages parsed by AbcListenProgramExtractor,
+# by article ID
+_prefetched = {}
+
+
+@cache(maxage=30*86400, keyarg=0)
+def _document_props_cache(key):
+    """Return cached 'documentProps' by '<article ID>_<updatedDate>'"""
+    return None
+
+
 def _smart_chain_from_iterable(iterable):
     """Yield nested `dict`s in `iterable`"""
     # ({}, [{}, {}], {}) -> ({}, {}, {}, {})
@@ -393,6 +521,10 @@ def _smart_chain_from_iterable(iterable):
             yield from item
 
 
+def _rendition_quality(rendition):
+    return (rendition.get("bitrate") or 0, rendition.get("fileSize") or 0)
+
+
 def _try_retrieve(obj, paths, default=None):
     for path in paths:
         try:
@@ -403,13 +535,58 @@ def _try_retrieve(obj, paths, default=None):
     return default
 
 
-def _initial_state(txt):
-    return util.json_loads(util.json_loads(text.extr(
-        txt, "__INITIAL_STATE__", "</script>").strip("\r\n =;")))
-
-
-def _next_data(txt):
-    return util.json_loads(text.extr(
-        txt,
-        '"__NEXT_DATA__" type="application/json">',
-        "</script>"))
+def _initial_state(content, path):
+    """Return the object at 'path' in the __INITIAL_STATE__ of a page"""
+    marker = b"__INITIAL_STATE__"
+    start = content.index(marker) + len(marker)
+    end = content.index(b"</script>", start)
+    # a JSON string containing JSON
+    return _json_path(util.json_loads(
+        content[start:end].decode().strip("\r\n =;")), path)
+
+
+def _next_data(content, path):
+    """Return the object at 'path' in the __NEXT_DATA__ of a page"""
+    marker = b'"__NEXT_DATA__" type="application/json">'
+    start = content.index(marker) + len(marker)
+    end = content.index(b"</script>", start)
+    return _json_path(content[start:end].decode(), path)
+
+
+_json_decoder = json.JSONDecoder()
+_json_strings = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"').sub
+_json_nested = re.compile(r"\{[^{}\[\]]*\}|\[[^{}\[\]]*\]").subn
+_json_residue = re.compile(r'[{}\[\]"]').search
+
+
+def _json_path(txt, path):
+    """Decode the object at 'path' in the JSON document 'txt'
+
+    Only the value at 'path' gets decoded if all of its keys can be found
+    in order, each one directly inside the object of the previous key.
+    Otherwise, the entire document is decoded.
+    """
+    start = json.decoder.WHITESPACE.match(txt).end()
+    for key in path:
+        if not isinstance(key, str):
+            break
+        needle = '"{}":'.format(key)
+        pos = txt.find(needle, start)
+        if pos < 0 or not _json_member(txt, start, pos):
+            break
+        start = json.decoder.WHITESPACE.match(txt, pos + len(needle)).end()
+    else:
+        return _json_decoder.raw_decode(txt, start)[0]
+    return reduce(getitem, path, util.json_loads(txt))
+
+
+def _json_member(txt, start, pos):
+    """Return True if 'pos' is directly inside the object at 'start'"""
+    if txt[start:start+1] != "{":
+        return False
+    # drop strings and all complete objects and arrays
+    segment = _json_strings("", txt[start+1:pos])
+    count = 1
+    while count:
+        segment, count = _json_nested("", segment)
+    return _json_residue(segment) is None
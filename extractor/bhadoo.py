@@ -3,7 +3,12 @@
 """Extractors for Bhadoo Drive Index"""
 
 from gallery_dl.extractor.common import BaseExtractor, Message
-from gallery_dl import text
+from gallery_dl import text, util
+from gallery_dl.cache import cache
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import queue
 
 
 class BhadooExtractor(BaseExtractor):
@@ -15,6 +20,8 @@ class BhadooExtractor(BaseExtractor):
     filename_fmt = "{id[:8]}_{filename}.{extension}"
 
     FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+    PATH_BATCH_SIZE = 100
+    QUEUE_SIZE = 100
 
     def __init__(self, match):
         BaseExtractor.__init__(self, match)
@@ -25,6 +32,10 @@ class BhadooExtractor(BaseExtractor):
 
     def _init(self):
         self._fetch_path = self.config("path", False)
+        # keys of failed lookups; these are not cached across runs
+        self._failed_paths = set()
+        workers = self.config("workers", 1)
+        self.pool = ThreadPoolExecutor(workers) if workers > 1 else None
 
     def prepare(self, file):
         """Adjust the content of a file or folder object"""
@@ -44,45 +55,132 @@ class BhadooExtractor(BaseExtractor):
 
     def items(self):
         self.api = BhadooAPI(self)
-        return self.files(self.base_path, self.id)
+        return self._shutdown_after(self.files(self.base_path, self.id))
+
+    def _shutdown_after(self, messages):
+        """Yield from 'messages' and cancel pending pool tasks afterwards"""
+        try:
+            yield from messages
+        finally:
+            if self.pool:
+                self.pool.shutdown(False, cancel_futures=True)
 
     def content(self, endpoint, id):
         """Interface for API endpoints"""
 
-    def _fetch_parent_path(self, id):
+    def _lookup_path(self, id, folder=False):
+        """Return the path of 'id' or None if it could not be determined"""
         path = self.api.path("/{}:id2path".format(self._drive_order), id)
         if not path:
+            return None
+        path = tuple(text.unquote(path.strip("/")).split("/"))
+        return path if folder else path[:-1]
+
+    def _path_key(self, id, folder):
+        return "{}|{}|{}{}".format(
+            self.root, self._drive_order, id, "/" if folder else "")
+
+    def _fetch_parent_path(self, id, folder=False):
+        """Return the path of the folder containing 'id'
+
+        If 'folder' is true, 'id' is the folder itself
+        """
+        key = self._path_key(id, folder)
+        if key in self._failed_paths:
             return ()
-        return tuple(text.unquote(path.strip("/")).split("/")[:-1])
+        path = _path_cache(key)
+        if path is None:
+            path = self._lookup_path(id, folder)
+            if path is None:
+                self._failed_paths.add(key)
+                return ()
+            _path_cache.update(key, path)
+        return path
+
+    def _path_id(self, file):
+        """Return the ID to look up the path of 'file' with"""
+        parents = file.get("parents")
+        if parents:
+            # shared by all files in the same folder
+            return parents[0], True
+        return file["id"], False
+
+    def _prefetch_paths(self, files):
+        """Yield 'files' after resolving their paths in batches
+
+        Each distinct ID gets looked up only once. Lookups that are not
+        cached yet run concurrently when 'workers' is greater than 1.
+        """
+        files = iter(files)
+        while True:
+            batch = list(itertools.islice(files, self.PATH_BATCH_SIZE))
+            if not batch:
+                return
+
+            missing = {}
+            for file in batch:
+                if file.get("id") and \
+                        file.get("mimeType") != self.FOLDER_MIME_TYPE:
+                    id, folder = self._path_id(file)
+                    key = self._path_key(id, folder)
+                    if key not in missing and \
+                            key not in self._failed_paths and \
+                            _path_cache(key) is None:
+                        missing[key] = (id, folder)
+
+            if self.pool and len(missing) > 1:
+                paths = self.pool.map(
+                    lambda args: self._lookup_path(*args), missing.values())
+            else:
+                paths = (self._lookup_path(*args)
+                         for args in missing.values())
+            for key, path in zip(missing, paths):
+                if path is None:
+                    self._failed_paths.add(key)
+                else:
+                    _path_cache.update(key, path)
+
+            yield from batch
 
-    def files(self, parent_path, id="", parent_data=None):
+    def _list_folder(self, parent_path, id):
+        return list(self.content(
+            endpoint="/{}/".format("/".join(parent_path)), id=id))
+
+    def files(self, parent_path, id="", parent_data=None, content=None):
         """Recursively yield files in a folder"""
         if not parent_path and id and self._fetch_path:
             parent_path = self._fetch_parent_path(id)
         folder_data = {"parent": parent_data, "path": parent_path}
         yield Message.Directory, folder_data
 
+        # if possible, fetch paths for individual files in search results
+        fetch_path = not parent_path and (id or id is None) and \
+            self._fetch_path
+        if content is not None:
+            files = content.result()
+        else:
+            # remove trailing slash to download as ZIP
+            files = self.content(
+                endpoint="/{}/".format("/".join(parent_path)), id=id)
+        if fetch_path:
+            files = self._prefetch_paths(files)
+
         folders = []
-        # remove trailing slash to download as ZIP
-        for file in self.content(
-                endpoint="/{}/".format("/".join(parent_path)), id=id):
+        for file in files:
             self.prepare(file)
             if file["mimeType"] == self.FOLDER_MIME_TYPE:
-                folders.append(file)
+                folders.append(self._subfolder(parent_path, file))
                 continue
             url = file.get("link")
             if not url:
                 self.log.debug("Download URL not found: %s", file["name"])
-                folders.append(file)
+                folders.append(self._subfolder(parent_path, file))
                 continue
             if url[0] == "/":
                 url = self.root + url
 
-            # if possible, fetch paths for individual files in search results
-            file_id = file.get("id")
-            if not parent_path and (id or id is None) and \
-                    file_id and self._fetch_path:
-                path = self._fetch_parent_path(file_id)
+            if fetch_path and file.get("id"):
+                path = self._fetch_parent_path(*self._path_id(file))
                 if path:
                     folder_data["path"] = path
                     yield Message.Directory, folder_data
@@ -90,10 +188,21 @@ class BhadooExtractor(BaseExtractor):
 
             yield Message.Url, url, file
 
-        for folder in folders:
+        for folder, content in folders:
             yield from self.files(
                 parent_path + (folder["name"],), id=folder.get("id") or "",
-                parent_data=folder)
+                parent_data=folder, content=content)
+
+    def _subfolder(self, parent_path, folder):
+        """Return a tuple of (folder, content)
+
+        'content' is a Future of its listing if 'workers' is greater than 1
+        """
+        if not self.pool:
+            return folder, None
+        return folder, self.pool.submit(
+            self._list_folder, parent_path + (folder["name"],),
+            folder.get("id") or "")
 
 
 BASE_PATTERN = BhadooExtractor.update({})
@@ -114,7 +223,7 @@ class BhadooFolderExtractor(BhadooExtractor):
 
     def __init__(self, match):
         BhadooExtractor.__init__(self, match)
-        path = match.group(match.lastindex)
+        path = match.group(match.re.groups)
         if path:
             if path.startswith("fallback?"):
                 # id-based
@@ -128,10 +237,55 @@ class BhadooFolderExtractor(BhadooExtractor):
     def _init(self):
         BhadooExtractor._init(self)
         if self.id:
+            self._drive_order = self._fetch_drive_order(self.url)
+
+    def _fetch_drive_order(self, url):
+        order = _drive_order_cache(url)
+        if order is None:
             # make a request to the webpage to determine the drive number
-            self._drive_order = text.extr(
-                self.request(self.url).text,
-                "current_drive_order", ";").strip(" =")
+            order = text.extr(
+                self.request(url).text, "current_drive_order", ";"
+            ).strip(" =")
+            # do not remember error or challenge pages
+            if order:
+                _drive_order_cache.update(url, order)
+        return order
+
+    def items(self):
+        if not self.id and not self.base_path and \
+                self.config("all-drives", False):
+            self.api = BhadooAPI(self)
+            return self._shutdown_after(self.drives())
+        return BhadooExtractor.items(self)
+
+    def drives(self):
+        """Crawl all drives of the index, one drive after another
+
+        With 'workers' greater than 1, up to that many drives are crawled
+        in the background at the same time
+        """
+        page = self.request(self.root + "/").text
+        names = text.extr(page, "drive_names = JSON.parse('", "')")
+        orders = range(len(util.json_loads(names))) if names else (0,)
+        self.log.debug("Found %s drive(s)", len(orders))
+
+        crawls = [self.files(("{}:".format(order),)) for order in orders]
+        workers = self.config("workers", 1)
+        if workers <= 1:
+            return itertools.chain.from_iterable(crawls)
+        return self._drives_concurrent(crawls, workers)
+
+    def _drives_concurrent(self, crawls, workers):
+        started = []
+        try:
+            for index in range(len(crawls)):
+                while len(started) < min(index + workers, len(crawls)):
+                    started.append(
+                        _produce(crawls[len(started)], self.QUEUE_SIZE))
+                yield from _consume(*started[index])
+        finally:
+            for items, stop in started:
+                _stop(items, stop)
 
     def content(self, endpoint, id):
         return self.api.folder_content(
@@ -156,7 +310,8 @@ class BhadooSearchExtractor(BhadooExtractor):
 
     def items(self):
         self.api = BhadooAPI(self)
-        return self.files(self.base_path, None)  # sentinel value
+        # None is a sentinel value
+        return self._shutdown_after(self.files(self.base_path, None))
 
     def content(self, endpoint, id):
         if id is None:
@@ -167,6 +322,71 @@ class BhadooSearchExtractor(BhadooExtractor):
             return self.api.folder_content(endpoint, id=id)
 
 
+def _background(iterable, size):
+    """Consume 'iterable' in a separate thread, at most 'size' items ahead"""
+    return _consume(*_produce(iterable, size))
+
+
+def _produce(iterable, size):
+    """Start consuming 'iterable' in a separate thread
+
+    Return a tuple of (queue, stop_event) to pass to _consume()
+    """
+    items = queue.Queue(size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                items.put((True, item))
+        except BaseException as exc:
+            items.put((False, exc))
+        else:
+            items.put((False, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    return items, stop
+
+
+def _consume(items, stop):
+    """Yield items produced by a thread started with _produce()"""
+    try:
+        while True:
+            ok, item = items.get()
+            if ok:
+                yield item
+            elif item is None:
+                return
+            else:
+                raise item
+    finally:
+        _stop(items, stop)
+
+
+def _stop(items, stop):
+    stop.set()
+    # unblock the producer if it is waiting for free space
+    try:
+        while True:
+            items.get_nowait()
+    except queue.Empty:
+        pass
+
+
+@cache(maxage=7*86400, keyarg=0)
+def _path_cache(key):
+    # 'None' marks paths that have not been looked up yet
+    return None
+
+
+@cache(maxage=30*86400, keyarg=0)
+def _drive_order_cache(url):
+    # 'None' marks drive orders that have not been looked up yet
+    return None
+
+
 class BhadooAPI():
     """Interface for the web API"""
 
@@ -174,6 +394,7 @@ class BhadooAPI():
         self.api_root = extractor.root
         self.request = extractor.request
         self.log = extractor.log
+        self.prefetch = extractor.config("prefetch", False)
 
         # handle misuse of 500 response code
         sreq = extractor.session.request
@@ -203,13 +424,21 @@ class BhadooAPI():
             return None
 
     def _pagination(self, endpoint, params):
+        pages = self._pages(endpoint, params)
+        if self.prefetch:
+            # request the next page while the current one is processed
+            pages = _background(pages, 1)
+        for page in pages:
+            yield from page["data"]["files"]
+
+    def _pages(self, endpoint, params):
         page_token = ""
         page_index = 0
         while True:
             params["page_token"] = page_token
             params["page_index"] = page_index
             page = self._call(endpoint, params)
-            yield from page["data"]["files"]
+            yield page
             page_token = page.get("nextPageToken")
             if not page_token:
                 break
@@ -3,8 +3,11 @@
 """Extractors for https://dbree.org/ and https://dbree.me/"""
 
 from gallery_dl.extractor.common import Extractor, Message
-from gallery_dl import text, util
-import itertools
+from gallery_dl import text, util, exception
+from gallery_dl.cache import cache
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import threading
 
 
 BASE_PATTERN = r"(?:https?://)?dbree\.(?:org|me)"
@@ -18,30 +21,108 @@ class DbreeExtractor(Extractor):
     root = "https://dbree.org"
 
     def _init(self):
+        # reuse session cookies that got past DDoS-Guard before
+        self.session.cookies.update(_cookie_cache())
+        self._cookies_saved = False
+        self._set_session_id()
+        # number of new sessions started after a DDoS-Guard challenge
+        self._session_count = 0
+        self._session_lock = threading.Lock()
+
+        self.workers = workers = self.config("workers", 1)
+        self.pool = ThreadPoolExecutor(workers) if workers > 1 else None
+
+    def _set_session_id(self):
         domain = self.root.rpartition("/")[2]
         cookies = self.session.cookies
         if not cookies.get("PHPSESSID", domain=domain):
             cookies.set("PHPSESSID", util.generate_token(13), domain=domain)
 
-    def items(self):
+    def request(self, url, **kwargs):
+        session_count = self._session_count
+        try:
+            response = Extractor.request(self, url, **kwargs)
+        except exception.HttpError as exc:
+            if not self._is_challenge(exc.response):
+                raise
+        else:
+            if not self._is_challenge(response):
+                if not self._cookies_saved:
+                    self._cookies_saved = True
+                    _cookie_cache.update("", self.session.cookies.copy())
+                return response
+
+        with self._session_lock:
+            # another thread might have started a new session already
+            if session_count == self._session_count:
+                self._new_session()
+        return Extractor.request(self, url, **kwargs)
+
+    def _new_session(self):
+        self.log.debug("DDoS-Guard challenge; starting a new session")
+        _cookie_cache.invalidate("")
+        self._cookies_saved = False
+        self._session_count += 1
+
+        # keep cookies that did not come from this extractor or DDoS-Guard
+        cookies = self.session.cookies
+        for cookie in list(cookies):
+            if cookie.name == "PHPSESSID" or cookie.name.startswith("__ddg"):
+                cookies.clear(cookie.domain, cookie.path, cookie.name)
+        self._set_session_id()
         self._prepare_ddosguard_cookies()
 
-        for file in self.files():
-            yield Message.Directory, file
+    @staticmethod
+    def _is_challenge(response):
+        if response is None:
+            return False
+        if "ddos-guard" not in response.headers.get("server", "").lower():
+            return False
+        return response.status_code == 403 or \
+            b"<title>ddos-guard</title>" in response.content[:4096].lower()
 
-            response = self.request("{}/v/{}".format(self.root, file["id"]))
-
-            extr = text.extract_from(response.text)
-            text.nameext_from_url(
-                text.unescape(extr("<li>Name: ", "</li>")), file)
-            file["filesize"] = extr("<li>Size: ", "</li>")
-            file["date"] = text.parse_datetime(
-                extr("<li>Created: ", "</li>"), "%Y-%m-%d %H:%M:%S")
-            file["last_download"] = text.parse_datetime(
-                extr("<li>Last Download: ", "</li>"), "%Y-%m-%d %H:%M:%S")
+    def items(self):
+        self._prepare_ddosguard_cookies()
 
-            url = "{}/d/{}".format(self.root, extr("'//dbree.org/d/", "'"))
-            yield Message.Url, url, file
+        if self.pool:
+            files = self._scrape_concurrent(self.files())
+        else:
+            files = map(self.scrape, self.files())
+
+        try:
+            for file, url in files:
+                yield Message.Directory, file
+                yield Message.Url, url, file
+        finally:
+            if self.pool:
+                self.pool.shutdown(False, cancel_futures=True)
+
+    def scrape(self, file):
+        """Add metadata from a file's webpage and return (file, url)"""
+        response = self.request("{}/v/{}".format(self.root, file["id"]))
+
+        extr = text.extract_from(response.text)
+        text.nameext_from_url(
+            text.unescape(extr("<li>Name: ", "</li>")), file)
+        file["filesize"] = extr("<li>Size: ", "</li>")
+        file["date"] = text.parse_datetime(
+            extr("<li>Created: ", "</li>"), "%Y-%m-%d %H:%M:%S")
+        file["last_download"] = text.parse_datetime(
+            extr("<li>Last Download: ", "</li>"), "%Y-%m-%d %H:%M:%S")
+
+        url = "{}/d/{}".format(self.root, extr("'//dbree.org/d/", "'"))
+        return file, url
+
+    def _scrape_concurrent(self, files):
+        """Scrape up to twice as many webpages as there are workers
+        ahead of the current file"""
+        window = deque()
+        for file in files:
+            window.append(self.pool.submit(self.scrape, file))
+            if len(window) >= self.workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
 
     def files(self):
         """Return an iterable of file objects"""
@@ -98,18 +179,33 @@ class DbreeSearchExtractor(DbreeExtractor):
         self.page = text.parse_int(match.group(2))
 
     def files(self):
-        for i in itertools.count(0):
-            url = "{}/s/{}&page={}".format(
-                self.root, self.search, self.page + self.per_page * i)
-            a = self.request(url)
+        url = "{}/s/{}&page={{}}".format(self.root, self.search)
+        page = self.page
+        response = self.request(url.format(page))
+        while True:
             ids = tuple(text.extract_iter(
-                a.text, "<a href='/v/", "'"))
+                response.text, "<a href='/v/", "'"))
             if not ids:
                 return
+
+            page += self.per_page
+            if self.pool:
+                # request the next page of results while the current one
+                # is being processed
+                future = self.pool.submit(self.request, url.format(page))
             for id in ids:
                 data = self.metadata()
                 data["id"] = id
                 yield data
+            if self.pool:
+                response = future.result()
+            else:
+                response = self.request(url.format(page))
 
     def metadata(self):
         return {"search": self.search}
+
+
+@cache(maxage=86400)
+def _cookie_cache():
+    return ()
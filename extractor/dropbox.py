@@ -3,8 +3,10 @@
 """Extractors for Dropbox"""
 
 from gallery_dl.extractor.common import Extractor, Message
-from gallery_dl import text, exception
+from gallery_dl import text, util, exception
 from gallery_dl.cache import cache
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 
 class DropboxShareExtractor(Extractor):
@@ -94,6 +96,41 @@ class DropboxShareExtractor(Extractor):
          }),
         ("https://www.dropbox.com/sh/bwjmb40klp8pj2t/"
          "AAC_25FuKfruJwoD6Sw2ZEbYa/foo/bar?dl=0"),
+
+        # direct links
+        ("https://www.dropbox.com/sh/bwjmb40klp8pj2t/"
+         "AACgqigq8Jwwio0mgEKgrr2Wa?dl=0", {
+             "options": (("direct", True),),
+             "count": 2,
+             "pattern": r"^https://dl\.dropboxusercontent\.com/sh/"
+                        r"bwjmb40klp8pj2t/[0-9a-zA-Z\-_]+/",
+             "content": "15feabe8e776daad90dc781c7d122852ea266b49",
+         }),
+        # file metadata
+        ("https://www.dropbox.com/s/bkyoamgqop7kpio/data.txt", {
+            "options": (("metadata", True),),
+            "count": 1,
+            "pattern": r"^https://[^/]+\.dropboxusercontent\.com/",
+            "keyword": {
+                "filename" : "data",
+                "extension": "txt",
+                "filesize" : int,
+            },
+            "content": "b31735ac7a09c30491f7c3e7069db7798f9c92c4",
+        }),
+        # whole folder as ZIP
+        ("https://www.dropbox.com/sh/6dwvd4l0fka2jju/"
+         "AADDIWyKVs6uQ0YjYYRtP6Xya?dl=0", {
+             "options": (("zip", True),),
+             "count": 1,
+             "pattern": r"/sh/6dwvd4l0fka2jju/AADDIWyKVs6uQ0YjYYRtP6Xya"
+                        r"\?dl=1$",
+             "keyword": {
+                 "extension": "zip",
+                 "filename" : "CyberLink",
+                 "path"     : (),
+             },
+         }),
     )
 
     def __init__(self, match):
@@ -110,6 +147,14 @@ class DropboxShareExtractor(Extractor):
 
     def _init(self):
         self.api = DropboxWebAPI(self)
+        self.direct = self.config("direct", False)
+        self.zip = self.config("zip", False)
+        # only folder listings make use of the pool
+        workers = self.config("workers", 1)
+        if workers > 1 and self.secure_hash and not self.zip:
+            self.pool = ThreadPoolExecutor(workers)
+        else:
+            self.pool = None
 
     def items(self):
         # https://dl.dropbox.com/s/{key}/[arbitrary filename]
@@ -117,10 +162,16 @@ class DropboxShareExtractor(Extractor):
         # https://dl.dropbox.com/sh/{key}/{hash}/[does not work for folders]
         if self.secure_hash:
             try:
-                yield from self.files(self.secure_hash, self.base_path)
+                if self.zip:
+                    yield from self.folder_zip()
+                else:
+                    yield from self.files(self.secure_hash, self.base_path)
                 return
             except exception.NotFoundError:
                 pass
+            finally:
+                if self.pool:
+                    self.pool.shutdown(False, cancel_futures=True)
         data = {
             "extension"  : "",
             "share_token": {
@@ -129,15 +180,44 @@ class DropboxShareExtractor(Extractor):
             },
             "path": (),
         }
+        if self.config("metadata", False):
+            direct_url = self.metadata(data)
+        else:
+            direct_url = None
         yield Message.Directory, data
-        yield self.commit(self.url, data)
+        # the share token belongs to the shared folder, not to the file
+        yield self.commit(self.url, data, direct_url, self.base_path[:-1])
 
-    def commit(self, url, data):
+    def metadata(self, data):
+        """Add file metadata from HTTP headers and return its content URL"""
+        url, headers = self.api.file_info(self.url)
+        data["filename"] = headers.get("filename", "")
+        data["extension"] = headers.get("extension", "")
+        data["filesize"] = headers.get("filesize", 0)
+        data["date"] = headers.get("date")
+        return url
+
+    def commit(self, url, data, direct_url=None, parents=()):
+        api_url = self.root + "/sharing/fetch_user_content_link"
         post_data = {
             "is_xhr": "true",
             "t"  : self.api.token,
             "url": url,
         }
+        if direct_url is None and self.direct:
+            direct_url = self._direct_url(data, parents)
+
+        def _use_api():
+            nonlocal direct_url
+            direct_url = None
+            data["_http_method"] = "POST"
+            data["_http_data"] = post_data
+
+        def _retry(response):
+            # switch to the API for the fallback URL
+            if direct_url:
+                _use_api()
+            return False
 
         def _validate(response):
             # * declared inside 'commit' to be able to access 'data'
@@ -145,6 +225,10 @@ class DropboxShareExtractor(Extractor):
             #   save 1 API request per file when skipping downloaded files
             if "filename" in response.headers.get("content-disposition", ""):
                 return True
+            if direct_url:
+                self.log.debug("Direct link failed; falling back to API")
+                _use_api()
+                return api_url
             if "text/plain" not in response.headers.get("content-type", ""):
                 return False
             url = response.text
@@ -155,13 +239,43 @@ class DropboxShareExtractor(Extractor):
             del data["_http_data"]
             return url
 
+        if direct_url:
+            data.update({
+                "_http_validate": _validate,
+                "_http_retry"   : _retry,
+                "_fallback"     : (api_url,),
+            })
+            return Message.Url, direct_url, data
+
         data.update({
             "_http_validate": _validate,
             "_http_method": "POST",
             "_http_data"  : post_data,
         })
-        return \
-            Message.Url, self.root + "/sharing/fetch_user_content_link", data
+        return Message.Url, api_url, data
+
+    def _direct_url(self, data, parents=()):
+        """Build a direct content URL from a file's share token
+
+        'parents' are the folders between the token's folder and the file.
+        Return None if the URL cannot be determined without the API
+        """
+        token = data["share_token"]
+        name = data.get("filename")
+        if name:
+            if data.get("extension"):
+                name = "{}.{}".format(name, data["extension"])
+        elif self.base_path:
+            name = self.base_path[-1]
+
+        if token["secureHash"]:
+            if not name:
+                return None
+            path = "/".join(map(quote, parents + (name,)))
+            return "https://dl.dropboxusercontent.com/sh/{}/{}/{}".format(
+                token["linkKey"], token["secureHash"], path)
+        return "https://dl.dropboxusercontent.com/s/{}/{}".format(
+            token["linkKey"], quote(name or "_"))
 
     @staticmethod
     def prepare(file):
@@ -170,17 +284,68 @@ class DropboxShareExtractor(Extractor):
         file["date"] = text.parse_timestamp(file["ts"])
         text.nameext_from_url(file["filename"], file)
 
-    def files(self, secure_hash, parent_path):
+    def folder_zip(self):
+        """Yield a folder as a single ZIP archive"""
+        folder, entries = self.api.folder_content(
+            self.key, self.secure_hash, "/".join(self.base_path))
+        if self.base is None:
+            self.base = (folder["filename"],)
+        path = self.base + self.base_path
+        # keep folder archives apart from the files they contain and
+        # download them again after a file directly inside was modified
+        self.archive_fmt = "zip_" + self.archive_fmt + "_{path:J/}_{ts}"
+        ts = max((entry.get("ts") or 0 for entry in entries), default=0)
+
+        data = {
+            "filename"   : path[-1],
+            "extension"  : "zip",
+            "share_token": folder["share_token"],
+            "parent"     : folder,
+            # the archive gets saved next to the folder it replaces
+            "path"       : path[:-1],
+            "ts"         : ts,
+            "date"       : text.parse_timestamp(ts) if ts else None,
+        }
+        yield Message.Directory, data
+
+        url = "{}/sh/{}/{}".format(self.root, self.key, self.secure_hash)
+        if self.base_path:
+            url += "/" + quote("/".join(self.base_path))
+        data["_http_validate"] = self._validate_zip
+        yield Message.Url, url + "?dl=1", data
+
+    @staticmethod
+    def _validate_zip(response):
+        return "filename" in response.headers.get("content-disposition", "")
+
+    def files(self, secure_hash, parent_path, content=None):
         """Recursively yield files in a folder"""
-        parent_data, items = \
-            self.api.folder_content(
-                self.key, secure_hash, "/".join(parent_path))
+        if content is not None:
+            parent_data, items = content.result()
+        elif self.pool:
+            parent_data, items = self._folder_content(secure_hash, parent_path)
+        else:
+            parent_data, items = \
+                self.api.folder_content(
+                    self.key, secure_hash, "/".join(parent_path))
 
         if self.base is None:
             self.base = (parent_data["filename"],)
         folder_data = {"parent": parent_data, "path": self.base + parent_path}
         yield Message.Directory, folder_data
 
+        if self.pool:
+            # list subfolders in the background while files are downloaded
+            subfolders = [
+                self.pool.submit(
+                    self._folder_content, item["share_token"]["secureHash"],
+                    parent_path + (item["filename"],))
+                for item in items
+                if item["is_dir"] or item["is_symlink"]
+            ]
+        else:
+            subfolders = None
+
         folders = []
         for item in items:
             if item["is_dir"] or item["is_symlink"]:  # ?
@@ -190,9 +355,20 @@ class DropboxShareExtractor(Extractor):
             item.update(folder_data)
             yield self.commit(item["shared_link_info"]["url"], item)
 
-        for folder in folders:
+        for index, folder in enumerate(folders):
             yield from self.files(folder["share_token"]["secureHash"],
-                                  parent_path + (folder["filename"],))
+                                  parent_path + (folder["filename"],),
+                                  subfolders[index] if subfolders else None)
+
+    def _folder_content(self, secure_hash, path):
+        """Return the complete content of a folder
+
+        Called from worker threads: 'self.api.token' is never modified
+        after initialization and the cookie jar does its own locking
+        """
+        parent_data, items = self.api.folder_content(
+            self.key, secure_hash, "/".join(path))
+        return parent_data, list(items)
 
 
 class DropboxWebAPI():
@@ -213,6 +389,24 @@ class DropboxWebAPI():
         self.request(self.API_ROOT, method="HEAD")
         return self.cookiejar["t"]
 
+    # content links stay valid for a few hours; caching them allows
+    # interrupted downloads to be resumed without another API request
+    @cache(maxage=3*3600, keyarg=1)
+    def file_info(self, url):
+        """Return a tuple of (content_url, response_headers)"""
+        data = {"is_xhr": "true", "t": self.token, "url": url}
+        url = self.request(
+            self.API_ROOT + "/sharing/fetch_user_content_link", data=data,
+            method="POST", notfound="file").text
+        if url[:8] != "https://":
+            raise exception.NotFoundError("file")
+        response = self.request(url, method="HEAD", notfound="file")
+        headers = util.extract_headers(response)
+        # case-insensitive lookup; 'headers' is a plain dict
+        headers["filesize"] = text.parse_int(
+            response.headers.get("content-length"))
+        return url, headers
+
     def folder_content(self, link_key, secure_hash, sub_path=""):
         """Return a tuple of (folder_info, folder_content)"""
         result = self._folder_content_impl(link_key, secure_hash, sub_path)
@@ -4,6 +4,10 @@
 
 from gallery_dl.extractor.common import Extractor, Message
 from gallery_dl import text, exception
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import datetime
+import time
 
 
 class PcloudShareExtractor(Extractor):
@@ -13,6 +17,8 @@ class PcloudShareExtractor(Extractor):
     directory_fmt = ("{category}", "{path[0]:?//}", "{path[1]:?//}",
                      "{path[2]:?//}", "{path[3:]:J - /}")
     archive_fmt = "{code}_{fileid}_{hash}"
+    PROBE_SIZE = 262144
+    EXPIRY_MARGIN = datetime.timedelta(minutes=5)
     pattern = (r"(?:https?://)?(?:([0-9a-z]+)\.pcloud\.(?:com|link)"
                r"(?:/#page=publink\&code=|/publink/show\?code=)|"
                r"([0-9a-z]+)\.pc\.cd/)([0-9a-zA-Z]+)")
@@ -45,6 +51,10 @@ class PcloudShareExtractor(Extractor):
             "pattern": r"^https://eapi\.pcloud\.com/getpublinkdownload",
             "content": "d52f6082cb729deb984d83bda236eb73d1eeec80",
         }),
+        ("https://e.pc.cd/KAWotalK", {
+            "options": (("probe-hosts", True),),
+            "content": "d52f6082cb729deb984d83bda236eb73d1eeec80",
+        }),
         # folder
         ("https://u.pcloud.link/publink/show?code="
          "kZuGtUXZjqkXZG6pCyJTO3VJHoKAWna7dM8gSU9gV", {
@@ -58,6 +68,20 @@ class PcloudShareExtractor(Extractor):
                  "path": ("Heckman-SE136746-MS-raw-files",),
              },
          }),
+        # incremental parsing
+        ("https://u.pcloud.link/publink/show?code="
+         "kZuGtUXZjqkXZG6pCyJTO3VJHoKAWna7dM8gSU9gV", {
+             "options": (("stream", True),),
+             "count": 12,
+             "keyword": {"path": ("Heckman-SE136746-MS-raw-files",)},
+         }),
+        # prefetched links
+        ("https://u.pcloud.link/publink/show?code="
+         "kZuGtUXZjqkXZG6pCyJTO3VJHoKAWna7dM8gSU9gV", {
+             "options": (("prefetch", 4),),
+             "count": 12,
+             "pattern": r"^https://[^/]+\.pcloud\.com/",
+         }),
         # expired
         ("https://u.pcloud.link/publink/show?code="
          "XZKWMYXZAXdC7K0Epj4iIb3NotWXgbXxKPck", {
@@ -81,9 +105,34 @@ class PcloudShareExtractor(Extractor):
             "https://{}api.pcloud.com".format("e" if "e" in subdomain else "")
         self.code = match.group(3)
 
+    def _init(self):
+        self.probe = self.config("probe-hosts", False)
+        self._host_speed = {}
+
+        self.ijson = None
+        if self.config("stream", False):
+            try:
+                import ijson
+                self.ijson = ijson
+            except ImportError as e:
+                self.log.warning(
+                    "Falling back to parsing the whole response (%s)", e)
+
     def items(self):
-        response = self.request(
-            "{}/showpublink?code={}".format(self.api_root, self.code)).json()
+        prefetch = self.config("prefetch", 0)
+        if prefetch > 0:
+            yield from self._prefetch(self.share_content(), prefetch)
+        else:
+            yield from self.share_content()
+
+    def share_content(self):
+        """Yield messages for all files of the share"""
+        url = "{}/showpublink?code={}".format(self.api_root, self.code)
+        if self.ijson:
+            yield from self.files_stream(self.request(url, stream=True))
+            return
+
+        response = self.request(url).json()
         try:
             items = (response.pop("metadata"),)
         except KeyError:
@@ -109,13 +158,12 @@ class PcloudShareExtractor(Extractor):
 
     def commit(self, data):
         def _validate(response):
-            if "content-disposition" in response.headers:
+            if "content-disposition" in response.headers or \
+                    "json" not in response.headers.get("content-type", ""):
                 return True
-            obj = response.json()
-            hosts = obj["hosts"]
-            template = "https://{}" + obj["path"]
-            data["_fallback"] = tuple(template.format(h) for h in hosts[1:])
-            return template.format(hosts[0])
+            urls = self._download_urls(response.json())
+            data["_fallback"] = urls[1:]
+            return urls[0]
 
         url = "{}/getpublinkdownload?code={}&forcedownload=1&fileid={}".format(
             self.api_root, self.code, data["fileid"])
@@ -123,6 +171,81 @@ class PcloudShareExtractor(Extractor):
         text.nameext_from_url(data["name"], data)
         return Message.Url, url, data
 
+    def _download_urls(self, obj):
+        """Return the download URLs of a 'getpublinkdownload' response"""
+        hosts = obj["hosts"]
+        if self.probe and len(hosts) > 1:
+            hosts = self._rank_hosts(hosts, obj["path"])
+        template = "https://{}" + obj["path"]
+        return tuple(template.format(host) for host in hosts)
+
+    def _prefetch(self, messages, num):
+        """Resolve the download links of the next 'num' files in the
+        background while the current one is being downloaded"""
+        queue = deque()
+        with ThreadPoolExecutor(num) as pool:
+            for msg in messages:
+                if msg[0] == Message.Url:
+                    future = pool.submit(self._resolve, msg[1])
+                else:
+                    # 'files()' reuses the same dict for all directories
+                    msg = (msg[0], msg[1].copy())
+                    future = None
+                queue.append((msg, future))
+                if len(queue) > num:
+                    yield self._resolved(*queue.popleft())
+            while queue:
+                yield self._resolved(*queue.popleft())
+
+    def _resolve(self, url):
+        return self.request(url).json()
+
+    def _resolved(self, msg, future):
+        """Replace the API URL of a message with a resolved one"""
+        if future is None:
+            return msg
+        _, url, data = msg
+        try:
+            obj = future.result()
+            expires = text.parse_datetime(
+                obj["expires"], "%a, %d %b %Y %H:%M:%S %z")
+            urls = self._download_urls(obj)
+        except (exception.HttpError, ValueError, KeyError):
+            # let the downloader resolve it
+            return msg
+
+        # links expire after a while; better ask again than fail
+        if not isinstance(expires, datetime.datetime) or \
+                expires < datetime.datetime.utcnow() + self.EXPIRY_MARGIN:
+            return msg
+
+        # on errors like 403 or 410, the API URL gets requested again
+        data["_fallback"] = urls[1:] + (url,)
+        return Message.Url, urls[0], data
+
+    def _rank_hosts(self, hosts, path):
+        """Return 'hosts' sorted by the throughput of a short request
+
+        Measurements are kept for the rest of the run, so each host
+        only gets probed once.
+        """
+        speed = self._host_speed
+        headers = {"Range": "bytes=0-{}".format(self.PROBE_SIZE - 1)}
+        for host in hosts:
+            if host in speed:
+                continue
+            start = time.time()
+            try:
+                response = self.request(
+                    "https://{}{}".format(host, path),
+                    headers=headers, retries=0, fatal=False)
+                size = len(response.content) if response.ok else 0
+            except exception.HttpError:
+                size = 0
+            speed[host] = size / max(time.time() - start, 0.001)
+            self.log.debug("%s: %.0f B/s", host, speed[host])
+        return sorted(hosts, key=speed.__getitem__, reverse=True)
+
     def files(self, items, data, parent_path):
         """Recursively yield files in a folder"""
         path = parent_path + (data["parent"].get("name"),)
@@ -143,3 +266,87 @@ class PcloudShareExtractor(Extractor):
         for folder in folders:
             data["parent"] = folder
             yield from self.files(folder.pop("contents"), data, path)
+
+    def files_stream(self, response):
+        """Yield files while parsing the response incrementally
+
+        Only the chain of parent folders is kept in memory. Files are
+        yielded in document order, and top-level fields that come after
+        'metadata' in the response are not available.
+        """
+        raw = response.raw
+        raw.decode_content = True
+        events = self.ijson.basic_parse(raw, use_float=True)
+        self._directory = None
+
+        data = self.metadata()
+        data["path"] = ()
+        found = False
+        next(events)  # start_map
+        for event, key in events:
+            if event == "end_map":
+                break
+            if key == "metadata":
+                next(events)  # start_map
+                found = True
+                yield from self._stream_item(events, data, (None,))
+            else:
+                data[key] = self._stream_value(events)
+
+        if not found:
+            self.log.debug("Response: %s", data)
+            raise exception.NotFoundError("file or folder")
+
+    def _stream_item(self, events, data, parent_path):
+        """Parse a file or folder object and yield its files"""
+        item = {}
+        folder = False
+        for event, key in events:
+            if event == "end_map":
+                break
+            if key != "contents":
+                item[key] = self._stream_value(events)
+                continue
+
+            # the object is a folder; files get yielded while its content
+            # is being parsed, so metadata has to be complete by now
+            folder = True
+            self.prepare(item)
+            path = parent_path + (item.get("name"),)
+            folder_data = data.copy()
+            folder_data["parent"] = item
+            folder_data["path"] = path[1:]
+
+            next(events)  # start_array
+            for event, _ in events:
+                if event == "end_array":
+                    break
+                yield from self._stream_item(events, folder_data, path)
+            # remaining keys are still added to 'item'
+
+        if folder:
+            return
+        self.prepare(item)
+        if self._directory is not data:
+            self._directory = data
+            yield Message.Directory, data
+        item.update(data)
+        yield self.commit(item)
+
+    def _stream_value(self, events):
+        """Return the next (complete) value"""
+        event, value = next(events)
+        if event != "start_map" and event != "start_array":
+            return value
+
+        builder = self.ijson.ObjectBuilder()
+        builder.event(event, value)
+        depth = 1
+        for event, value in events:
+            builder.event(event, value)
+            if event == "start_map" or event == "start_array":
+                depth += 1
+            elif event == "end_map" or event == "end_array":
+                depth -= 1
+                if not depth:
+                    return builder.value
@@ -3,10 +3,17 @@
 """Extractors for Podbean"""
 
 from gallery_dl.extractor.common import Extractor, Message
-from gallery_dl import text, exception, ytdl
+from gallery_dl import text, util, config, exception, ytdl
+from gallery_dl.cache import cache
 from requests import exceptions as rexc
 from urllib3.exceptions import HTTPError as UrllibHTTPError
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from operator import itemgetter
+import functools
+import threading
+import hashlib
+import io
 
 
 class PodbeanFeedExtractor(Extractor):
@@ -14,6 +21,7 @@ class PodbeanFeedExtractor(Extractor):
     category = "podbean"
     subcategory = "feed"
     archive_fmt = "{itunes_author}_{itunes_image}_{filename}.{extension}"
+    HASH_SIZE = 65536
     directory_fmt = ("{category}", "{itunes_author}")
     filename_fmt = ("S{itunes_season|'0':>02}E{itunes_episode:?//>03} - "
                     "{title|filename}.{extension}")
@@ -115,6 +123,23 @@ class PodbeanFeedExtractor(Extractor):
                 "Dumping response is not supported for this extractor")
             self._write_pages = False
 
+        segmented = self.config("segmented")
+        if isinstance(segmented, str):
+            segmented = text.parse_bytes(segmented)
+        if segmented:
+            module = config.get(("downloader", "ytdl"), "module")
+            try:
+                ytdl.import_module(module)
+            except ImportError as e:
+                self.log.warning(
+                    "Disabling 'segmented' (cannot import '%s')", e.name)
+                segmented = None
+            else:
+                options = config.get(("downloader", "ytdl"), "raw-options")
+                if not options or "external_downloader" not in options:
+                    self.log.debug("'segmented' without external downloader")
+        self.segmented = segmented
+
         # opportunistically use youtube-dl or yt-dlp's function instead
         # of our own, rudimentary implementation
         try:
@@ -124,36 +149,18 @@ class PodbeanFeedExtractor(Extractor):
             self.log.debug(
                 "Falling back to basic tracking prefix removal (%s)", e)
 
-        # by default, the Python implementation of XMLParser is shadowed by
-        # the C implementation; we undo this to be able get the original
-        # namespace prefixes
-        # see https://stackoverflow.com/a/55261552
-        import _elementtree
-        try:
-            del _elementtree.XMLParser
-        except AttributeError:
-            # in case deleted twice
-            return
-
-        try:
-            from xml.parsers import expat
-        except ImportError:
-            try:
-                import pyexpat as expat
-            except ImportError:
-                return
-
-        old_pc = expat.ParserCreate
-
-        def ParserCreatePatched(*args, **kwargs):
-            args = list(args)
+        import xml.etree.ElementTree as ET
+        self._iterparse_impl = ET.iterparse
+        if self.config("lxml", False):
             try:
-                args[1] = None
-            except IndexError:
-                kwargs["namespace_separator"] = None
-            return old_pc(*args, **kwargs)
-
-        expat.ParserCreate = ParserCreatePatched
+                from lxml import etree
+            except ImportError as e:
+                self.log.warning(
+                    "Falling back to xml.etree.ElementTree (%s)", e)
+            else:
+                self._iterparse_impl = functools.partial(
+                    etree.iterparse, recover=True, resolve_entities=False,
+                    huge_tree=True, remove_comments=True, remove_pis=True)
 
     @staticmethod
     def prepare_metadata(metadata):
@@ -203,32 +210,38 @@ class PodbeanFeedExtractor(Extractor):
             if key in item:
                 item[key] = text.parse_int(item[key])
 
-    def _try_parse_raw(self, raw):
-        import xml.etree.ElementTree as ET
-        response = None
-        tries = 1
+    def _iterparse(self, raw, tags):
+        """Yield children of <channel> as soon as they are complete
 
-        while True:
-            try:
-                return ET.parse(raw)
-            except (UrllibHTTPError,
-                    rexc.ConnectionError,
-                    rexc.Timeout,
-                    rexc.ChunkedEncodingError,
-                    rexc.ContentDecodingError) as exc:
-                msg = exc
-            except rexc.RequestException as exc:
-                raise exception.HttpError(exc)
-
-            self.log.debug("%s (%s/%s)", msg, tries, self._retries+1)
-            if tries > self._retries:
-                break
-            self.sleep(
-                max(tries, self._interval()) if self._interval else tries,
-                "retry")
-            tries += 1
-
-        raise exception.HttpError(msg, response)
+        Namespace prefixes get recorded in 'tags'.
+        Processed <item> elements get removed from the tree.
+        """
+        namespaces = tags.namespaces
+        depth = 0
+        channel = None
+
+        try:
+            for event, element in self._iterparse_impl(
+                    raw, ("start", "end", "start-ns")):
+                if event == "start":
+                    depth += 1
+                    if depth == 2 and tags[element.tag][0] == "channel":
+                        channel = element
+                    continue
+                if event == "start-ns":
+                    prefix, uri = element
+                    namespaces.setdefault(uri, prefix)
+                    continue
+
+                depth -= 1
+                if depth != 2 or channel is None:
+                    continue
+                yield element
+                if tags[element.tag][0] == "item":
+                    channel.remove(element)
+                    element.clear()
+        except (UrllibHTTPError, rexc.RequestException) as exc:
+            raise exception.HttpError(exc)
 
     @staticmethod
     def _delegate_url(kwds, getter):
@@ -239,103 +252,514 @@ class PodbeanFeedExtractor(Extractor):
             return getter(kwds)
 
     def items(self):
+        if not self.config("conditional", False):
+            return self.feed(_ResumableReader(self, self._open_feed()))
+        return self._items_conditional()
+
+    def _open_feed(self, headers=None):
         # XXX: this might break if the site switches to Cloudflare
         # in the future
-        raw = self.request(self.feed_url, notfound="user", stream=True).raw
-        raw.decode_content = True
+        response = self.request(
+            self.feed_url, notfound="user", stream=True, headers=headers)
+        response.raw.decode_content = True
         # raw.read = functools.partial(raw.read, decode_content=True)
-        root = self._try_parse_raw(raw).getroot()
+        return response
+
+    def _items_conditional(self):
+        """Skip feeds that did not change since the last run"""
+        cached = _feed_cache(self.feed_url)
+        headers = {}
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last-modified"):
+            headers["If-Modified-Since"] = cached["last-modified"]
+
+        response = self._open_feed(headers)
+        if response.status_code == 304:
+            self.log.info("Feed not modified")
+            return
+
+        reader = _ResumableReader(self, response)
+        length = response.headers.get("Content-Length")
+        if length:
+            # for servers ignoring conditional requests; newer episodes
+            # are at the top, so a changed feed has a different beginning
+            # or a different size
+            head = reader.read(self.HASH_SIZE)
+            digest = hashlib.sha1(head)
+            digest.update(length.encode())
+            digest = digest.hexdigest()
+            if digest == cached.get("hash"):
+                self.log.info("Feed not modified")
+                response.close()
+                return
+            reader = _PrefixedReader(head, reader)
+        else:
+            # appended episodes would go unnoticed without a known size
+            digest = None
+
+        yield from self.feed(reader)
+
+        # only remember a feed after all of its episodes were processed
+        _feed_cache.update(self.feed_url, {
+            "etag"         : response.headers.get("ETag"),
+            "last-modified": response.headers.get("Last-Modified"),
+            "hash"         : digest,
+        })
+
+    def feed(self, raw):
+        """Yield messages for all entries of a feed"""
+        podcast_logo = self.config("podcast-logo", True)
+        episode_image = self.config("episode-logo", True)
+
+        archive_stop = self.config("archive-stop")
+        archive = self._open_archive() if archive_stop else None
+        archived = 0
+        tags = self._tags = _Tags()
 
-        items = []
         channel_metadata = []
-        for child in root.findall("./channel/"):
-            if child.tag == "item":
-                items.append(child)
-            else:
-                channel_metadata.append(child)
+        metadata = None
+        late_metadata = False
+        # episodes preceding all channel metadata
+        pending = []
+
+        for element in self._iterparse(raw, tags):
+            if tags[element.tag][0] != "item":
+                channel_metadata.append(element)
+                if metadata is not None:
+                    late_metadata = True
+                continue
 
-        image_getter = itemgetter("itunes_image")
+            if archive and channel_metadata:
+                if self._archived(archive, element):
+                    archived += 1
+                    if archived >= archive_stop:
+                        self.log.info(
+                            "Stopping after %d consecutive archived episodes",
+                            archived)
+                        break
+                else:
+                    archived = 0
+
+            data = self.episode_metadata(element)
+            if metadata is None:
+                if not channel_metadata:
+                    pending.append(data)
+                    continue
+                metadata = self.channel_metadata(channel_metadata)
+                if podcast_logo and "itunes_image" in metadata:
+                    podcast_logo = False
+                    yield from self.podcast_logo(metadata)
+                for episode in pending:
+                    yield from self.episode(episode, metadata, episode_image)
+                pending = None
+            yield from self.episode(data, metadata, episode_image)
+
+        if metadata is None:
+            metadata = self.channel_metadata(channel_metadata)
+        elif late_metadata:
+            # channel metadata following the first <item>
+            metadata.update(self.channel_metadata(channel_metadata))
+        if podcast_logo and "itunes_image" in metadata:
+            yield from self.podcast_logo(metadata)
+        if pending:
+            for episode in pending:
+                yield from self.episode(episode, metadata, episode_image)
+
+        if archive:
+            archive.close()
+
+    def _open_archive(self):
+        """Open the download archive configured for this extractor"""
+        path = self.config("archive")
+        if not path:
+            self.log.warning("'archive-stop' requires a download archive")
+            return None
+        if "{" in path:
+            self.log.warning("'archive-stop' does not support archive paths "
+                             "with replacement fields")
+            return None
+
+        fmt = (self.config("archive-prefix", self.category) +
+               self.config("archive-format", self.archive_fmt))
+        try:
+            return util.DownloadArchive(util.expand_path(path), fmt)
+        except Exception as exc:
+            self.log.warning("Failed to open download archive at '%s' "
+                             "(%s: %s)", path, exc.__class__.__name__, exc)
+            return None
+
+    def _archived(self, archive, item):
+        """Return True if the audio file of an <item> is in 'archive'
+
+        Only top-level children of 'item' are looked at, which is
+        sufficient for the fields used by the default archive format.
+        """
+        data = _item_to_dict(item, self._tags, False)
+        data["category"] = self.category
+        data["subcategory"] = self.subcategory
+
+        try:
+            if data["media_content"]["medium"] == "image":
+                data["itunes_image"] = data.pop("media_content")["url"]
+        except KeyError:
+            pass
 
-        metadata = _elements_to_dict(
-            channel_metadata, get_key=_get_key_metadata, extr=_extr_metadata)
+        try:
+            url = self._clean_url(_audio_getter(data))
+        except KeyError:
+            return False
+        data["audio"] = url
+        text.nameext_from_url(url, data)
+        return archive.check(data)
+
+    def channel_metadata(self, elements):
+        """Return podcast metadata from children of <channel>"""
+        metadata = _channel_to_dict(elements, self._tags)
         self.prepare_metadata(metadata)
-        if self.config("podcast-logo", True) and "itunes_image" in metadata:
-            data = metadata.copy()
-            if "image" in metadata:
-                image = metadata["image"]
-                for key in ("width", "height"):
-                    if key in image:
-                        data[key] = image[key]
+        return metadata
 
-            yield Message.Directory, data
+    def podcast_logo(self, metadata):
+        data = metadata.copy()
+        if "image" in metadata:
+            image = metadata["image"]
+            for key in ("width", "height"):
+                if key in image:
+                    data[key] = image[key]
+
+        yield Message.Directory, data
+
+        url = self._delegate_url(metadata, _image_getter)
+        text.nameext_from_url(url, data)
+        yield Message.Url, url, data
+
+    def episode_metadata(self, item):
+        """Return episode metadata from an <item>"""
+        data = _item_to_dict(item, self._tags)
+        self.prepare_item(data)
+        return data
 
-            url = self._delegate_url(metadata, image_getter)
+    def episode(self, data, metadata, episode_image=True):
+        data["podcast"] = metadata
+        yield Message.Directory, data
+
+        if episode_image and "itunes_image" in data:
+            url = self._delegate_url(data, _image_getter)
             text.nameext_from_url(url, data)
             yield Message.Url, url, data
 
-        episode_image = self.config("episode-logo", True)
+        # /mf/web/ is basically the same as /mf/download/, the
+        # only difference is the 'content-disposition' header
+        url = self._clean_url(self._delegate_url(data, _audio_getter))
+        text.nameext_from_url(url, data)
+        # data["episode_id"] = url.split("/")[-2]
+        audio = data.pop("enclosure")
+        data["audio"] = url
+        data["filesize"] = audio["length"]
+        data["mimetype"] = audio["type"]
+        if self.segmented:
+            if data["filesize"] >= self.segmented:
+                # let youtube-dl/yt-dlp and its external downloader handle it
+                url = "ytdl:" + url
+            elif data["filesize"]:
+                data["_http_validate"] = self._size_validator(
+                    data["filesize"])
+        yield Message.Url, url, data
+
+    def _size_validator(self, filesize):
+        """Return a function comparing the size of an audio file
+        with the length given in its enclosure"""
+        def _validate(response):
+            headers = response.headers
+            size = text.parse_int(
+                headers.get("Content-Range", "").rpartition("/")[2] or
+                headers.get("Content-Length"), None)
+            if size is not None and size != filesize:
+                # enclosure lengths are often only approximate
+                self.log.warning("%s: Size mismatch (%s != %s bytes)",
+                                 response.url, size, filesize)
+            return True
+        return _validate
+
+
+class PodbeanOpmlExtractor(PodbeanFeedExtractor):
+    """Extractor for all feeds in an OPML subscription list"""
+    subcategory = "opml"
+    pattern = r"opml:(.+)"
+    test = (
+        ("opml:https://example.org/subscriptions.opml"),
+        ("opml:~/podcasts.opml"),
+    )
 
-        def audio_getter(obj):
-            return obj["enclosure"]["url"]
+    def __init__(self, match):
+        PodbeanFeedExtractor.__init__(self, match)
+        self.source = match.group(1)
 
-        for item in items:
-            data = _elements_to_dict(
-                item, pred=_pred_item, extr=_extr_item)
-            self.prepare_item(data)
-            data["podcast"] = metadata
-            yield Message.Directory, data
+    def _init(self):
+        PodbeanFeedExtractor._init(self)
+        self.workers = workers = self.config("workers", 1)
+        self.pool = ThreadPoolExecutor(workers) if workers > 1 else None
+        self.host_workers = self.config("host-workers", 2)
+        self._semaphores = {}
+        self._lock = threading.Lock()
 
-            if episode_image and "itunes_image" in data:
-                url = self._delegate_url(data, image_getter)
-                text.nameext_from_url(url, data)
-                yield Message.Url, url, data
+    def items(self):
+        if self.pool:
+            feeds = self._fetch_concurrent(self.feeds())
+        else:
+            feeds = map(self.fetch, self.feeds())
+
+        total = failed = 0
+        try:
+            for url, content in feeds:
+                total += 1
+                if isinstance(content, Exception):
+                    failed += 1
+                    self.log.warning("%s: %s", url, content)
+                    continue
+
+                count = 0
+                try:
+                    for msg in self.feed(io.BytesIO(content)):
+                        if msg[0] == Message.Url:
+                            count += 1
+                        yield msg
+                except SyntaxError as exc:
+                    # xml.etree.ElementTree.ParseError, lxml.etree.ParseError
+                    failed += 1
+                    self.log.warning("%s: Invalid feed (%s)", url, exc)
+                else:
+                    self.log.info("%s: %d files", url, count)
+        finally:
+            if self.pool:
+                self.pool.shutdown(False, cancel_futures=True)
+
+        self.log.info("%d feeds processed, %d failed", total, failed)
+
+    def feeds(self):
+        """Yield the feed URLs of all outlines"""
+        if self.source.startswith(("https://", "http://")):
+            content = self.request(self.source, notfound="OPML file").content
+        else:
+            try:
+                with open(util.expand_path(self.source), "rb") as fp:
+                    content = fp.read()
+            except OSError as exc:
+                raise exception.StopExtraction(
+                    "Failed to read OPML file (%s: %s)",
+                    exc.__class__.__name__, exc)
+
+        import xml.etree.ElementTree as ET
+        try:
+            root = ET.fromstring(content)
+        except ET.ParseError as exc:
+            raise exception.StopExtraction("Invalid OPML file (%s)", exc)
+
+        seen = set()
+        for outline in root.iter("outline"):
+            url = outline.get("xmlUrl")
+            if url and url not in seen:
+                seen.add(url)
+                yield url
+
+    def fetch(self, url):
+        """Download a feed and return (url, content or exception)"""
+        with self._host_semaphore(url):
+            try:
+                response = self.request(url, notfound="feed", stream=True)
+                response.raw.decode_content = True
+                return url, _ResumableReader(self, response).read()
+            except exception.ExtractionError as exc:
+                return url, exc
+            except (UrllibHTTPError, rexc.RequestException) as exc:
+                # transfer errors after all resume attempts failed
+                return url, exception.HttpError(exc)
+
+    def _fetch_concurrent(self, urls):
+        """Download up to twice as many feeds as there are workers
+        ahead of the current one"""
+        window = deque()
+        for url in urls:
+            window.append(self.pool.submit(self.fetch, url))
+            if len(window) >= self.workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+    def _host_semaphore(self, url):
+        """Return a semaphore limiting concurrent requests to a host"""
+        host = text.root_from_url(url)
+        with self._lock:
+            try:
+                return self._semaphores[host]
+            except KeyError:
+                semaphore = self._semaphores[host] = \
+                    threading.BoundedSemaphore(self.host_workers)
+                return semaphore
+
+
+class _ResumableReader():
+    """File-like object for the content of a streamed response
+
+    Interrupted transfers continue with a 'Range' request starting
+    at the number of bytes read so far.
+    """
+
+    def __init__(self, extractor, response):
+        self.extractor = extractor
+        self.response = response
+        self.position = 0
+        self.tries = 0
+
+        # decoded content is only equivalent to an unencoded
+        # representation, which gets requested explicitly when resuming
+        headers = response.headers
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/") and \
+                "Content-Encoding" not in headers:
+            self.validator = etag
+        else:
+            self.validator = headers.get("Last-Modified")
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            while True:
+                chunk = self.read(65536)
+                if not chunk:
+                    return b"".join(chunks)
+                chunks.append(chunk)
+
+        while True:
+            try:
+                data = self.response.raw.read(size)
+            except (UrllibHTTPError, rexc.RequestException) as exc:
+                self._resume(exc)
+            else:
+                self.position += len(data)
+                return data
+
+    def _resume(self, exc):
+        extr = self.extractor
+        response = self.response
+        self.tries += 1
+        if self.tries > extr._retries:
+            raise exc
+        extr.log.warning("%s: %s (resuming at byte %s, %s/%s)",
+                         response.url, exc.__class__.__name__,
+                         self.position, self.tries, extr._retries)
+
+        headers = {
+            "Range"          : "bytes={}-".format(self.position),
+            "Accept-Encoding": "identity",
+        }
+        if self.validator:
+            headers["If-Range"] = self.validator
+        response.close()
+
+        new = extr.request(response.url, headers=headers, stream=True)
+        start = new.headers.get("Content-Range", "").partition(" ")[2]
+        if new.status_code != 206 or "Content-Encoding" in new.headers or \
+                text.parse_int(start.partition("-")[0], -1) != self.position:
+            new.close()
+            raise exception.HttpError(
+                "Unable to resume feed download ({})".format(exc), new)
+        self.response = new
 
-            # /mf/web/ is basically the same as /mf/download/, the
-            # only difference is the 'content-disposition' header
-            url = self._clean_url(self._delegate_url(data, audio_getter))
-            text.nameext_from_url(url, data)
-            # data["episode_id"] = url.split("/")[-2]
-            audio = data.pop("enclosure")
-            data["audio"] = url
-            data["filesize"] = audio["length"]
-            data["mimetype"] = audio["type"]
-            yield Message.Url, url, data
+
+class _PrefixedReader():
+    """File-like object that returns 'prefix' before the content of 'fp'"""
+
+    def __init__(self, prefix, fp):
+        self.prefix = prefix
+        self.fp = fp
+
+    def read(self, size=-1):
+        prefix = self.prefix
+        if not prefix:
+            return self.fp.read(size)
+        if size is None or size < 0:
+            self.prefix = b""
+            return prefix + self.fp.read()
+        self.prefix = prefix[size:]
+        return prefix[:size]
+
+
+@cache(maxage=90*86400, keyarg=0)
+def _feed_cache(url):
+    return {}
+
+
+_image_getter = itemgetter("itunes_image")
+
+
+def _audio_getter(obj):
+    return obj["enclosure"]["url"]
 
 
 ###############################################################################
 # XML Parsers #################################################################
 
 
-_ns_map = (
-    ("{http://www.w3.org/2005/Atom}", "atom"),
-    ("{http://purl.org/rss/1.0/modules/content/}", "content"),
-    ("{http://www.itunes.com/dtds/podcast-1.0.dtd}", "itunes"),
-    ("{http://search.yahoo.com/mrss/}", "media"),
-    ("{https://podcastindex.org/namespace/1.0}", "podcast"),
-    ("{http://purl.org/dc/elements/1.1/}", "dc"),
-)
+_ns_prefixes = {
+    "http://www.w3.org/2005/Atom"              : "atom",
+    "http://purl.org/rss/1.0/modules/content/" : "content",
+    "http://www.itunes.com/dtds/podcast-1.0.dtd": "itunes",
+    "http://search.yahoo.com/mrss/"            : "media",
+    "https://podcastindex.org/namespace/1.0"   : "podcast",
+    "http://purl.org/dc/elements/1.1/"         : "dc",
+}
 
+# kinds of elements
+_TEXT, _GUID, _ENCLOSURE, _MEDIA, _CATEGORY, _LOCKED, _SKIP = range(7)
 
-def _get_key(element):
-    tag = element.tag
-    if ":" not in tag:
-        return tag
-    if "{" not in tag:
-        # original prefix
-        return tag.replace(":", "_")
-    # monkey patch failed for some reason; we remove the prefix ourselves
-    for ns, orig in _ns_map:
-        if ns in tag:
-            return "{}_{}".format(orig, tag.rpartition("}")[-1])
-    return tag
 
+class _Tags(dict):
+    """Map element tags to (key, kind) tuples
 
-def _get_key_metadata(element):
-    key = _get_key(element)
-    if key != "itunes_category":
-        return key
-    # smuggle 'text'
-    return (key, element.attrib["text"])
+    'namespaces' maps namespace URIs to the prefixes used in a document.
+    Keys combine prefix and local name, e.g. 'itunes_image'.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.namespaces = {}
+
+    def __missing__(self, tag):
+        if not isinstance(tag, str):
+            # lxml entities, comments, and processing instructions
+            self[tag] = value = (None, _SKIP)
+            return value
+
+        uri = None
+        key = tag
+        if tag[0] == "{":
+            uri, _, name = tag[1:].partition("}")
+            prefix = self.namespaces.get(uri)
+            if prefix is None:
+                prefix = _ns_prefixes.get(uri)
+            if prefix:
+                key = "{}_{}".format(prefix, name)
+            elif prefix is not None:
+                # default namespace
+                key = name
+
+        if key == "guid":
+            kind = _GUID
+        elif key == "enclosure":
+            kind = _ENCLOSURE
+        elif key.startswith("media_") or \
+                uri == "http://search.yahoo.com/mrss/":
+            kind = _MEDIA
+        elif key == "itunes_category":
+            kind = _CATEGORY
+        elif tag.endswith("locked"):
+            kind = _LOCKED
+        else:
+            kind = _TEXT
+
+        self[tag] = value = (key, kind)
+        return value
 
 
 def _flatten(key, value):
@@ -370,41 +794,50 @@ def _extr(element):
     return txt
 
 
-def _extr_item(element):
-    if element.tag == "guid":
-        data = {"guid": element.text}
-        data.update(element.attrib)
-        data["isPermaLink"] = data["isPermaLink"] == "true"
-        return data
+def _item_to_dict(element, tags, nested=True):
+    """Convert an <item> element (or one of its children) into a dict
 
-    if element.tag == "enclosure" or \
-        element.tag.startswith("media:") or \
-            "search.yahoo.com" in element.tag:
-        return element.attrib
-
-    return _extr(element)
-
-
-def _extr_metadata(element):
-    if element.tag.endswith("locked"):
-        data = element.attrib.copy()
-        data["locked"] = _extr(element)
-        return data
-
-    return _extr(element)
-
-
-def _pred_item(element):
-    if element.tag.startswith("media:") or "search.yahoo.com" in element.tag:
-        return False
-    return len(element)
-
-
-def _elements_to_dict(element, pred=len, get_key=_get_key, extr=_extr):
-    """Recursively extract useful information in an element (or a
-    list of elements) and convert it into a `dict`
+    Children with children of their own are skipped if 'nested' is false.
     """
-    if pred(element):
-        return {get_key(child): _elements_to_dict(child, pred, get_key, extr)
-                for child in element}
-    return extr(element)
+    data = {}
+    for child in element:
+        key, kind = tags[child.tag]
+        if kind == _SKIP:
+            continue
+        if kind == _MEDIA:
+            value = dict(child.attrib)
+        elif len(child):
+            if not nested:
+                continue
+            value = _item_to_dict(child, tags)
+        elif kind == _ENCLOSURE:
+            value = dict(child.attrib)
+        elif kind == _GUID:
+            value = {"guid": child.text}
+            value.update(child.attrib)
+            value["isPermaLink"] = value["isPermaLink"] == "true"
+        else:
+            value = _extr(child)
+        data[key] = value
+    return data
+
+
+def _channel_to_dict(elements, tags):
+    """Convert children of <channel> (or one of them) into a dict"""
+    data = {}
+    for child in elements:
+        key, kind = tags[child.tag]
+        if kind == _SKIP:
+            continue
+        if kind == _CATEGORY:
+            # smuggle 'text'
+            key = (key, child.attrib["text"])
+        if len(child):
+            value = _channel_to_dict(child, tags)
+        elif kind == _LOCKED:
+            value = dict(child.attrib)
+            value["locked"] = _extr(child)
+        else:
+            value = _extr(child)
+        data[key] = value
+    return data
@@ -4,6 +4,10 @@
 
 from gallery_dl.extractor.common import Extractor, Message
 from gallery_dl import util, text, exception
+from gallery_dl.cache import cache
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import itertools
 
 
 class YandexdiskShareExtractor(Extractor):
@@ -65,6 +69,28 @@ class YandexdiskShareExtractor(Extractor):
          "%94%D0%9A%2B02.01.%2B", {
              "count": 6,
          }),
+        # restricted fields
+        ("https://disk.yandex.com/d/DCXoxtp5f236ag/%D0%A2%D0%9C-19-9-1%20%D0"
+         "%9C%D0%94%D0%9A%2002.01.%20", {
+             "options": (("fields", True),),
+             "count": 6,
+             "keyword": {
+                 "path"   : ("ТМ-19-9-1 МДК 02.01. ",),
+                 "preview": None,
+                 "sizes"  : None,
+             },
+         }),
+        # whole folder as ZIP
+        ("https://disk.yandex.com/d/DCXoxtp5f236ag/%D0%A2%D0%9C-19-9-1%20%D0"
+         "%9C%D0%94%D0%9A%2002.01.%20", {
+             "options": (("zip", True),),
+             "count": 1,
+             "pattern": r"/public/api/download-url$",
+             "keyword": {
+                 "extension": "zip",
+                 "filename" : "ТМ-19-9-1 МДК 02.01. ",
+             },
+         }),
         # 404
         ("https://disk.yandex.ru/d/fooOIfxY5R_DEA", {
             "exception": exception.NotFoundError,
@@ -107,28 +133,41 @@ class YandexdiskShareExtractor(Extractor):
 
     def items(self):
         self.api = YandexdiskWebAPI(self)
-        self.sk = "y" + util.generate_token(16)
+        # reuse the last valid 'sk' and the cookies it is associated with
+        sk, cookies = _sk_cache()
+        if sk:
+            self.session.cookies.update(cookies)
+            self.sk = sk
+        else:
+            self.sk = "y" + util.generate_token(16)
 
         if not self.hash:
             url = "{}/{}".format(self.root, self.url.split("/", 3)[3])
             response = self.request(url, notfound="file or folder")
             self.hash = text.extr(response.text, '"hash":"', '"')
 
-        yield from self.files(self.base_path)
+        if self.config("zip", False):
+            yield from self.folder_zip()
+        else:
+            yield from self.files(self.base_path)
 
-    def commit(self, data):
+    def commit(self, data, hash=None):
         # declared inside 'commit' to be able to access 'data'
-        post_data = {"hash": self.hash, "sk": self.sk}
+        post_data = {"hash": hash or self.hash, "sk": self.sk}
+        api_url = self.root + "/public/api/download-url"
+
+        def _use_api():
+            data.update({
+                "_http_method" : "POST",
+                "_http_headers": {"Content-Type": "text/plain"},
+                "_http_data"   : util.json_dumps(post_data),
+            })
 
         def _retry(response):
             if "disposition" in response.url:
                 # if for whatever reason file["file"] fails, prepare to
                 # use "/public/api/download-url"
-                data.update({
-                    "_http_method" : "POST",
-                    "_http_headers": {"Content-Type": "text/plain"},
-                    "_http_data"   : util.json_dumps(post_data),
-                })
+                _use_api()
                 return False
             # handle 'sk'
             if response.status_code != 400:
@@ -144,6 +183,7 @@ class YandexdiskShareExtractor(Extractor):
                 return False
             post_data["sk"] = self.sk = new_sk
             data["_http_data"] = util.json_dumps(post_data)
+            _sk_cache.update("", (new_sk, self.session.cookies))
             return True
 
         def _validate(response):
@@ -161,15 +201,49 @@ class YandexdiskShareExtractor(Extractor):
             return obj["data"]["url"]
 
         data.update({
-            "_fallback"     : (self.root + "/public/api/download-url",),
             "_http_validate": _validate,
             "_http_retry"   : _retry,
         })
+        if "file" not in data:
+            # folders can only be downloaded through the API
+            _use_api()
+            return Message.Url, api_url, data
+
+        data["_fallback"] = (api_url,)
         # this approach is more complex than getting sk from webpage,
         # but requesting the API endpoint instead of the webpage
         # may help avoid CAPTCHAs
         return Message.Url, data["file"], data
 
+    def folder_zip(self):
+        """Yield a folder as a single ZIP archive"""
+        path = "/" + "/".join(self.base_path)
+        folder, _ = self.api.folder_content(self.hash, path)
+        if folder["type"] == "file":
+            yield from self.files(self.base_path)
+            return
+
+        self.prepare(folder)
+        if self.base is None:
+            self.base = (folder["name"],)
+        path = self.base + self.base_path
+        # keep folder archives apart from the files they contain
+        self.archive_fmt = "zip_{resource_id}_{modified}"
+
+        del folder["total"]
+        folder.update({
+            "filename" : path[-1],
+            "extension": "zip",
+            # the archive gets saved next to the folder it replaces
+            "path"     : path[:-1],
+        })
+        yield Message.Directory, folder
+        if self.base_path:
+            yield self.commit(folder, "{}:/{}".format(
+                self.hash, "/".join(self.base_path)))
+        else:
+            yield self.commit(folder)
+
     def files(self, parent_path):
         """Recursively yield files in the folder"""
         parent_data, items = \
@@ -207,9 +281,25 @@ class YandexdiskWebAPI():
 
     API_ROOT = "https://cloud-api.yandex.net/v1/disk/public"
     PER_PAGE = 200
+    # resource fields used by the extractor and its default formats
+    FIELDS = ("name", "type", "path", "created", "modified", "resource_id",
+              "revision", "size", "md5", "sha256", "mime_type", "media_type",
+              "file", "public_key", "public_url")
 
     def __init__(self, extractor):
         self.request = extractor.request
+        self.per_page = extractor.config("page-size") or self.PER_PAGE
+        self.workers = extractor.config("workers", 1)
+
+        fields = extractor.config("fields", False)
+        if fields:
+            if not isinstance(fields, (list, tuple)):
+                fields = self.FIELDS
+            self.fields = ",".join(
+                tuple(fields) + ("_embedded.total",) +
+                tuple("_embedded.items." + field for field in fields))
+        else:
+            self.fields = None
 
     def folder_content(self, hash, path="/", offset=0):
         """Return a tuple of (folder_info, folder_content)"""
@@ -218,20 +308,20 @@ class YandexdiskWebAPI():
 
     def _folder_content_impl(self, hash, path, offset):
         params = {
-            "limit"     : self.PER_PAGE,
+            "limit"     : self.per_page,
             "public_key": hash,
             "path"      : path,
         }
+        if self.fields:
+            params["fields"] = self.fields
         folder = None
         while True:
             params["offset"] = offset
-            response = self._call("/resources", params, notfound="resource")
-            embedded = response.pop("_embedded", {})
-            response["total"] = total = embedded.get("total") or 0
+            response, items = self._resources(params)
+            total = response["total"]
             if folder is None:
                 folder = response
                 yield folder
-            items = embedded.get("items") or ()
             if not items:
                 # this happens when the total number of returned items
                 # is smaller than 'total'
@@ -240,7 +330,60 @@ class YandexdiskWebAPI():
             offset += len(items)
             if offset >= total:
                 break
+            if self.workers > 1:
+                yield from self._pages_concurrent(params, offset, total)
+                break
+
+    def _pages_concurrent(self, params, offset, total):
+        """Fetch up to twice as many pages as there are workers ahead
+        of the current one and yield their items in order"""
+        limit = params["limit"]
+        offsets = iter(range(offset, total, limit))
+
+        def fetch(offset):
+            return self._resources(dict(params, offset=offset))[1]
+
+        pool = ThreadPoolExecutor(self.workers)
+        window = deque(
+            (offset, pool.submit(fetch, offset))
+            for offset in itertools.islice(offsets, self.workers * 2))
+        try:
+            while window:
+                offset, future = window.popleft()
+                items = future.result()
+                for offset_next in itertools.islice(offsets, 1):
+                    window.append(
+                        (offset_next, pool.submit(fetch, offset_next)))
+
+                # a page with fewer items than requested would leave
+                # a gap before the next one
+                end = min(offset + limit, total)
+                while True:
+                    if not items:
+                        # an empty page ends the listing, as it does
+                        # when fetching pages sequentially
+                        return
+                    yield from items
+                    offset += len(items)
+                    if offset >= end:
+                        break
+                    items = self._resources(dict(
+                        params, offset=offset, limit=end - offset))[1]
+        finally:
+            pool.shutdown(False, cancel_futures=True)
+
+    def _resources(self, params):
+        """Return a tuple of (resource, embedded_items)"""
+        response = self._call("/resources", params, notfound="resource")
+        embedded = response.pop("_embedded", {})
+        response["total"] = embedded.get("total") or 0
+        return response, embedded.get("items") or ()
 
     def _call(self, endpoint, params, **kwargs):
         return self.request(
             self.API_ROOT + endpoint, params=params, **kwargs).json()
+
+
+@cache(maxage=86400)
+def _sk_cache():
+    return None, ()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Compare partial and full decoding of JSON embedded in ABC Listen pages
+
+Usage: bench_abc.py [RUNS]
+"""
+
+import json
+import os
+import sys
+import time
+from functools import reduce
+from operator import getitem
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "extractor"))
+import abc_  # noqa E402
+from gallery_dl import util  # noqa E402
+
+
+def blob(num):
+    return {
+        "id"    : "123456789",
+        "title" : "Title " * 8,
+        "html"  : "<p>" + "lorem ipsum " * 50 + "</p>",
+        "nested": [{"a": i, "b": [1, 2, 3], "c": {"d": "e" * 20}}
+                   for i in range(num)],
+    }
+
+
+def next_data_page():
+    dp = blob(20)
+    dp["renditions"] = [{"url": "https://example.org/a.mp3", "bitrate": 128}]
+    dp["datelinePrepared"] = {"updatedDate": "2024-01-01T00:00:00+00:00"}
+    data = {"props": {"pageProps": {
+        "navigation": [blob(30) for _ in range(40)],
+        "data"      : {"documentProps": dp,
+                       "related": [blob(30) for _ in range(60)]},
+        "footer"    : [blob(20) for _ in range(30)],
+    }}, "page": "/listen", "buildId": "abc"}
+    return (
+        "<html><head>" + "<script>var x=1;</script>" * 200 + "</head><body>" +
+        "<div>" + "text " * 20000 + "</div>" +
+        '<script id="__NEXT_DATA__" type="application/json">' +
+        json.dumps(data, separators=(",", ":")) +
+        "</script></body></html>"
+    ).encode()
+
+
+def initial_state_page():
+    state = {"route": {"pageData": blob(30),
+                       "other"   : [blob(30) for _ in range(80)]}}
+    return (
+        "<html>" + "x" * 200000 + "<script>window.__INITIAL_STATE__ = " +
+        json.dumps(json.dumps(state)) + ";</script></html>"
+    ).encode()
+
+
+def full_decode(content, marker, path, string=False):
+    start = content.index(marker) + len(marker)
+    end = content.index(b"</script>", start)
+    obj = util.json_loads(content[start:end].decode().strip("\r\n =;"))
+    if string:
+        obj = util.json_loads(obj)
+    return reduce(getitem, path, obj)
+
+
+def best(func, runs):
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if result is None or elapsed < result:
+            result = elapsed
+    return result * 1000.0
+
+
+def compare(name, full, partial, runs):
+    assert full() == partial()
+    print("{}: full {:.2f} ms, partial {:.2f} ms".format(
+        name, best(full, runs), best(partial, runs)))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+
+    content = next_data_page()
+    path = ("props", "pageProps", "data", "documentProps")
+    marker = b'"__NEXT_DATA__" type="application/json">'
+    compare(
+        "__NEXT_DATA__ ({} KiB)".format(len(content) // 1024),
+        lambda: full_decode(content, marker, path),
+        lambda: abc_._next_data(content, path),
+        runs)
+
+    content = initial_state_page()
+    path = ("route", "pageData")
+    compare(
+        "__INITIAL_STATE__ ({} KiB)".format(len(content) // 1024),
+        lambda: full_decode(content, b"__INITIAL_STATE__", path, True),
+        lambda: abc_._initial_state(content, path),
+        runs)
+
+
+if __name__ == "__main__":
+    main()
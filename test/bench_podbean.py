@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Measure how fast PodbeanFeedExtractor.feed() processes a large feed
+
+Usage: bench_podbean.py [EPISODES [RUNS]]
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "extractor"))
+import podbean  # noqa E402
+from gallery_dl import config  # noqa E402
+
+
+CHANNEL = (
+    '<title>Show</title>'
+    '<itunes:author>Author</itunes:author>'
+    '<itunes:image href="https://example.org/logo.jpg"/>'
+    '<image><url>https://example.org/logo.jpg</url><width>100</width>'
+    '</image>'
+    '<itunes:category text="Technology">'
+    '<itunes:category text="News"/></itunes:category>'
+    '<podcast:locked owner="user@example.org">no</podcast:locked>'
+    '<ttl>60</ttl>'
+    '<pubDate>Mon, 01 Jan 2024 00:00:00 +0000</pubDate>'
+)
+
+ITEM = (
+    '<item>'
+    '<title>Episode {0}</title>'
+    '<pubDate>Mon, 01 Jan 2024 00:00:00 +0000</pubDate>'
+    '<link>https://example.org/e{0}</link>'
+    '<description>Episode description</description>'
+    '<guid isPermaLink="false">guid-{0}</guid>'
+    '<dc:creator>Author</dc:creator>'
+    '<content:encoded><![CDATA[<p>Show notes</p>]]></content:encoded>'
+    '<enclosure url="https://mcdn.podbean.com/mf/web/abc/e{0}.mp3" '
+    'length="{1}" type="audio/mpeg"/>'
+    '<media:content url="https://example.org/e{0}.jpg" medium="image"/>'
+    '<itunes:episode>{0}</itunes:episode>'
+    '<itunes:explicit>no</itunes:explicit>'
+    '<itunes:duration>00:30:00</itunes:duration>'
+    '</item>'
+)
+
+
+def generate_feed(episodes):
+    items = "".join(ITEM.format(i, 1000000 + i) for i in range(episodes))
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" '
+        'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" '
+        'xmlns:media="http://search.yahoo.com/mrss/" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+        'xmlns:podcast="https://podcastindex.org/namespace/1.0" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/">'
+        '<channel>' + CHANNEL + items + '</channel></rss>'
+    ).encode()
+
+
+def benchmark(content, lxml, runs):
+    config.set(("extractor", "podbean"), "lxml", lxml)
+    extr = podbean.PodbeanFeedExtractor.from_url(
+        "podbean:https://example.org/feed.xml")
+    extr.initialize()
+
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in extr.feed(io.BytesIO(content)):
+            pass
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    content = generate_feed(episodes)
+    print("{} episodes, {} KiB".format(episodes, len(content) // 1024))
+
+    for lxml in (False, True):
+        elapsed = benchmark(content, lxml, runs)
+        print("{:<6}: {:>8.0f} episodes/s ({:.3f}s)".format(
+            "lxml" if lxml else "etree", episodes / elapsed, elapsed))
+
+
+if __name__ == "__main__":
+    main()
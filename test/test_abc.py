@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "extractor"))
+import abc_  # noqa E402
+
+
+PATH = ("props", "pageProps", "data", "documentProps")
+
+
+class TestJsonPath(unittest.TestCase):
+
+    def test_json_path(self):
+        self.assertEqual(abc_._json_path(
+            '{"props": {"pageProps": {"data": {"documentProps": '
+            '{"id": "1"}}}}}', PATH), {"id": "1"})
+
+    def test_json_path_missing(self):
+        with self.assertRaises(KeyError):
+            abc_._json_path(
+                '{"props":{"pageProps":{"data":{}}},'
+                '"related":{"documentProps":{"id":"other"}}}', PATH)
+
+    def test_json_path_nested(self):
+        # same keys deeper inside of preceding siblings and strings
+        self.assertEqual(abc_._json_path(
+            '{"props":{"x":{"pageProps":{"data":{"documentProps":2}}},'
+            '"s":"\\"pageProps\\":{[","pageProps":{"data":{'
+            '"related":{"documentProps":3},"documentProps":1}}}}', PATH), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "extractor"))
+import bhadoo  # noqa E402
+
+
+def crawl(name, num=3, delay=0.2):
+    for i in range(num):
+        time.sleep(delay)
+        yield name, i
+
+
+class TestBackground(unittest.TestCase):
+
+    def test_background(self):
+        self.assertEqual(
+            list(bhadoo._background(crawl("a", delay=0), 1)),
+            [("a", 0), ("a", 1), ("a", 2)])
+
+    def test_background_exception(self):
+        def fail():
+            yield 1
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            list(bhadoo._background(fail(), 1))
+
+    def test_drives_concurrent(self):
+        extr = bhadoo.BhadooFolderExtractor.from_url(
+            "bhadoo:https://example.org/")
+        crawls = [crawl(name) for name in "abc"]
+
+        start = time.monotonic()
+        results = list(extr._drives_concurrent(crawls, 3))
+        elapsed = time.monotonic() - start
+
+        # output stays grouped by drive
+        self.assertEqual(
+            results, [(name, i) for name in "abc" for i in range(3)])
+        # 3 drives taking 0.6s each, crawled at the same time
+        self.assertLess(elapsed, 1.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "extractor"))
+import dbree  # noqa E402
+from gallery_dl import config  # noqa E402
+
+
+class TestDbree(unittest.TestCase):
+
+    def tearDown(self):
+        config.clear()
+
+    def test_initialize(self):
+        config.set(("extractor", "dbree"), "cookies", {"user": "value"})
+        extr = dbree.DbreeSearchExtractor.from_url("https://dbree.org/s/test")
+        extr.initialize()
+        extr._prepare_ddosguard_cookies()
+
+        cookies = extr.cookies
+        self.assertIs(cookies, extr.session.cookies)
+        self.assertEqual(cookies.get("user"), "value")
+        self.assertTrue(cookies.get("PHPSESSID", domain="dbree.org"))
+        self.assertTrue(cookies.get("__ddg2"))
+
+
+if __name__ == "__main__":
+    unittest.main()